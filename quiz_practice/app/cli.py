@@ -0,0 +1,246 @@
+"""Terminal app for QUIZ ON-AIR practice.
+
+Quizzes are answered by lines from stdin, so this works over SSH and with piped input.
+
+    1-4    answer the quiz
+    r      toggle adding the quiz to review list (before or after answering)
+    n      skip to the next quiz
+    Enter  go to the next quiz after answering
+    q      save and quit (also on EOF)
+"""
+import argparse
+import os
+import random
+import sys
+
+from typing import TextIO
+
+from quiz_practice.app.common import DATA_DIR
+from quiz_practice.app.common import DATA_FILENAME
+from quiz_practice.app.common import GENRE
+from quiz_practice.app.common import Mode
+from quiz_practice.app.common import RESPONSE_TIME_DATA_FILENAME
+from quiz_practice.app.common import REVIEW_DATA_FILENAME
+from quiz_practice.app.common import Session
+from quiz_practice.app.common import XLSX_FILENAME
+from quiz_practice.app.common import XLSX_PATH
+from quiz_practice.utils.response_time import format_response_time_report
+from quiz_practice.utils.response_time import load_response_time
+from quiz_practice.utils.save_data import compact_save_data
+from quiz_practice.utils.save_data import format_compaction_report
+from quiz_practice.utils.save_data import list_save_data
+from quiz_practice.utils.save_data import parse_save_data_filename
+
+CHOICE_COMMANDS = ["1", "2", "3", "4"]
+QUIZ_COMMANDS = CHOICE_COMMANDS + ["n", "q"]
+ANSWERED_COMMANDS = ["", "q"]
+
+
+class Drill:
+    """Terminal drill class."""
+
+    def __init__(
+        self,
+        session: Session,
+        default_review: bool = False,
+        stdin: TextIO = sys.stdin,
+        stdout: TextIO = sys.stdout,
+    ):
+        """Initialize."""
+        self.session = session
+        self.default_review = default_review
+        self.review_check = default_review
+        self.stdin = stdin
+        self.stdout = stdout
+
+    def print(self, *args) -> None:
+        """Print to stdout."""
+        print(*args, file=self.stdout)
+
+    def run(self) -> None:
+        """Load quizzes and answer them in a locked session."""
+        self.session.load()
+        if self.session.n_quizzes == 0:
+            match self.session.mode:
+                case Mode.WRONG:
+                    self.print("間違えた問題がないよ！")
+                case Mode.REVIEW:
+                    self.print("復習リストに問題がないよ！")
+                case Mode.SLOW:
+                    self.print("解答時間の記録がないよ！")
+                case Mode.RESTART:
+                    self.print("全て解き終わってるよ！")
+            return
+
+        is_finish = False
+        while not is_finish:
+            self.display_quiz()
+            command = self.read_command(QUIZ_COMMANDS, "1-4: 解答, r: 復習リスト切替, n: スキップ, q: 終了")
+            if command is None or command == "q":
+                break
+            if command in CHOICE_COMMANDS:
+                self.display_answer(int(command) - 1)
+                command = self.read_command(ANSWERED_COMMANDS, "Enter: 次の問題へ, r: 復習リスト切替, q: 終了")
+                if command is None or command == "q":
+                    break
+            is_finish = self.session.is_last
+            if not is_finish:
+                self.session.next(review_check=self.review_check)
+        self.close(is_finish=is_finish)
+
+    def read_command(self, commands: list[str], usage: str) -> str | None:
+        """Read a command from stdin, toggling review list on "r", return None on EOF."""
+        while True:
+            self.stdout.write(f"({usage}) > ")
+            self.stdout.flush()
+            line = self.stdin.readline()
+            if line == "":
+                return None
+            command = line.strip().lower()
+            if command == "r":
+                self.review_check = not self.review_check
+                self.print(f"復習リストに追加する: {'はい' if self.review_check else 'いいえ'}")
+            elif command in commands:
+                return command
+            else:
+                self.print(f"{usage} のいずれかを入力してね！")
+
+    def display_quiz(self) -> None:
+        """Display quiz."""
+        self.session.start_quiz()
+        self.review_check = self.default_review
+        current_quiz = self.session.current_quiz
+        self.print("")
+        self.print(f"({self.session.quiz_idx+1}問目 / {self.session.n_quizzes}問中) ジャンル: {current_quiz['genre']}")
+        self.print(current_quiz["quiz"])
+        for choice_idx, choice in enumerate(current_quiz["choices"]):
+            self.print(f"  #{choice_idx+1} {choice}")
+
+    def display_answer(self, selected_idx: int) -> None:
+        """Display answer."""
+        answer_idx = self.session.answer_idx
+        answer = self.session.current_quiz["answer"]
+        if self.session.answer(selected_idx):
+            self.print(f"正解！ #{answer_idx+1} {answer}")
+        else:
+            self.print(f"不正解… 正解は #{answer_idx+1} {answer}")
+
+    def close(self, is_finish: bool = False) -> None:
+        """Save data and finish drill."""
+        save_data_path = self.session.close(review_check=self.review_check, is_finish=is_finish)
+        if len(self.session.response_time_record.qid_histograms) > 0:
+            self.print(format_response_time_report(self.session.response_time_record))
+        self.print(f"{os.path.basename(save_data_path)} に記録したよ！")
+
+
+def main() -> None:
+    """Run terminal drill."""
+    # the frozen exe keeps data next to itself, otherwise data are in the current directory
+    if getattr(sys, "frozen", False):
+        default_data_dir = DATA_DIR
+        default_xlsx_path = XLSX_PATH
+    else:
+        default_data_dir = "data"
+        default_xlsx_path = XLSX_FILENAME
+
+    parser = argparse.ArgumentParser(description="もちうさドリル (terminal)")
+    parser.add_argument("-m", "--mode", choices=[mode.value for mode in Mode], default=Mode.NORMAL.value)
+    parser.add_argument(
+        "-g", "--genre", choices=list(GENRE.keys()), action="append", help="default: all genres (not for restart/wrong)"
+    )
+    parser.add_argument("-s", "--save", type=int, help="save data index for restart/wrong mode (default: latest)")
+    parser.add_argument("-d", "--data-dir", default=default_data_dir, help=f"default: {default_data_dir}")
+    parser.add_argument("--random", action="store_true", help="shuffle quizzes")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible runs")
+    parser.add_argument("--default-review", action="store_true", help="add quizzes to review list by default")
+    parser.add_argument(
+        "--response-time",
+        action=argparse.BooleanOptionalAction,
+        help="record response time (default: only when stdin is a terminal)",
+    )
+    parser.add_argument("--list-saves", action="store_true", help="list save data and exit")
+    parser.add_argument("--report", action="store_true", help="show response time report and exit")
+    parser.add_argument("--qid", action="append", help="questions to show in --report (default: the slowest)")
+    parser.add_argument(
+        "--n-slowest", type=int, default=10, help="number of the slowest questions in --report (0: all, default: 10)"
+    )
+    parser.add_argument("--compact", action="store_true", help="compact and merge save data and exit")
+    parser.add_argument("--load-quiz", nargs="?", const=default_xlsx_path, metavar="XLSX", help="load quizzes and exit")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir
+    if args.load_quiz is not None:
+        from quiz_practice.utils.utils import parse_xlsx
+
+        if not os.path.exists(args.load_quiz):
+            sys.exit(f"{args.load_quiz} が見つかりません！")
+        parse_xlsx(xlsx_path=args.load_quiz, save_path=os.path.join(data_dir, DATA_FILENAME))
+        print("読込み完了！")
+        return
+    if not os.path.isdir(data_dir):
+        sys.exit(f"{data_dir} が見つかりません！まずは --load-quiz で問題集を読込んでください！")
+    if args.compact:
+        report = compact_save_data(data_dir, merge=True)
+        if report is None:
+            sys.exit("セーブデータが使用中のため整理をスキップしました。")
+        print(format_compaction_report(report))
+        return
+    if args.list_saves:
+        for save_data_path in list_save_data(data_dir):
+            idx, mode = parse_save_data_filename(save_data_path)
+            print(f"{idx:03d} {mode}")
+        return
+    if args.report:
+        record = load_response_time(os.path.join(data_dir, RESPONSE_TIME_DATA_FILENAME))
+        if len(record.qid_histograms) == 0:
+            sys.exit("解答時間の記録がないよ！")
+        n_qids = None if args.n_slowest <= 0 else args.n_slowest
+        print(format_response_time_report(record, n_qids=n_qids, qids=args.qid))
+        return
+
+    mode = Mode(args.mode)
+    if mode in [Mode.WRONG, Mode.RESTART]:
+        # genres are not selectable as the save data are written back
+        if args.genre is not None:
+            parser.error(f"--genre cannot be used with --mode {mode.value}")
+    elif mode == Mode.REVIEW and not os.path.exists(os.path.join(data_dir, REVIEW_DATA_FILENAME)):
+        sys.exit("復習リストに問題がないよ！")
+    elif not os.path.exists(os.path.join(data_dir, DATA_FILENAME)):
+        sys.exit("まずは --load-quiz で問題集を読込んでください！")
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.response_time is None:
+        # piped answers are too fast to be meaningful
+        record_response_time = sys.stdin.isatty()
+    else:
+        record_response_time = args.response_time
+
+    session = Session(
+        data_dir=data_dir,
+        mode=mode,
+        stages=list(GENRE.keys()) if args.genre is None else args.genre,
+        is_random=args.random,
+        record_response_time=record_response_time,
+    )
+    if not session.lock():
+        sys.exit("セーブデータを整理中だよ！少し待ってからやり直してね！")
+    try:
+        # select save data after locking not to be renumbered by compaction
+        if mode in [Mode.WRONG, Mode.RESTART]:
+            save_data_path_list = list_save_data(data_dir)
+            if args.save is None:
+                save_data_path_list = save_data_path_list[-1:]
+            else:
+                save_data_path_list = [
+                    path for path in save_data_path_list if parse_save_data_filename(path)[0] == args.save
+                ]
+            if len(save_data_path_list) == 0:
+                sys.exit("セーブデータが見つかりません！")
+            session.save_data_path = save_data_path_list[0]
+        Drill(session, default_review=args.default_review).run()
+    finally:
+        session.unlock()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Common settings and session for GUI and terminal apps."""
+import enum
+import json
+import os
+import random
+import sys
+import time
+
+from quiz_practice.utils.response_time import load_response_time
+from quiz_practice.utils.response_time import ResponseTimeRecord
+from quiz_practice.utils.response_time import save_response_time
+from quiz_practice.utils.save_data import acquire_session_lock
+from quiz_practice.utils.save_data import release_lock
+from quiz_practice.utils.save_data import write_new_save_data
+
+GENRE = {
+    "stage1": "文学＆歴史",
+    "stage2": "自然科学",
+    "stage3": "現代社会＆地理",
+    "stage4": "グルメ＆趣味",
+    "stage5": "アニメ＆ゲーム",
+}
+G2S = {
+    "文学＆歴史": "stage1",
+    "自然科学": "stage2",
+    "現代社会＆地理": "stage3",
+    "グルメ＆趣味": "stage4",
+    "アニメ＆ゲーム": "stage5",
+}
+
+
+EXE_DIR = os.path.dirname(sys.executable)
+DATA_DIR = os.path.join(EXE_DIR, "data")
+DATA_FILENAME = "data.quiz"
+REVIEW_DATA_FILENAME = "review_data.quiz"
+RESPONSE_TIME_DATA_FILENAME = "response_time.quiz"
+DATA_PATH = os.path.join(DATA_DIR, DATA_FILENAME)
+REVIEW_DATA_PATH = os.path.join(DATA_DIR, REVIEW_DATA_FILENAME)
+RESPONSE_TIME_DATA_PATH = os.path.join(DATA_DIR, RESPONSE_TIME_DATA_FILENAME)
+XLSX_FILENAME = "クイズオンエア問題集.xlsx"
+XLSX_PATH = os.path.join(EXE_DIR, XLSX_FILENAME)
+N_SLOW_QUIZZES = 10  # per genre
+
+
+class Mode(enum.Enum):
+    """Practice mode."""
+
+    NORMAL = "normal"
+    RESTART = "restart"
+    WRONG = "wrong"
+    REVIEW = "review"
+    SLOW = "slow"
+
+
+def load_slow_quizzes(
+    data_path: str, response_time_data_path: str
+) -> dict[str, dict[str, list[dict[str, str | list[str]]]]]:
+    """Load the slowest quizzes of each genre."""
+    with open(data_path, encoding="utf-8") as f:
+        all_data = json.load(f)
+    slow_qids = load_response_time(response_time_data_path).slowest_qids()
+    slow_quizzes = {quiz["qid"]: quiz for stage in GENRE.keys() for quiz in all_data[stage]["quiz_list"]}
+    data = {stage: {"quiz_list": []} for stage in GENRE.keys()}
+    for qid in slow_qids:
+        if qid in slow_quizzes:
+            quiz = slow_quizzes[qid]
+            slow_quiz_list = data[G2S[quiz["genre"]]]["quiz_list"]
+            if len(slow_quiz_list) < N_SLOW_QUIZZES:
+                slow_quiz_list.append(quiz)
+    return data
+
+
+class Session:
+    """Practice session shared by GUI and terminal apps."""
+
+    def __init__(
+        self,
+        data_dir: str,
+        mode: Mode,
+        stages: list[str],
+        save_data_path: str | None = None,
+        is_random: bool = False,
+        record_response_time: bool = True,
+    ):
+        """Initialize."""
+        self.data_path = os.path.join(data_dir, DATA_FILENAME)
+        self.review_data_path = os.path.join(data_dir, REVIEW_DATA_FILENAME)
+        self.response_time_data_path = os.path.join(data_dir, RESPONSE_TIME_DATA_FILENAME)
+        self.data_dir = data_dir
+        self.mode = mode
+        # restart and wrong modes write back to the save data, so all genres are needed not to lose quizzes
+        if mode in [Mode.RESTART, Mode.WRONG]:
+            stages = list(GENRE.keys())
+        self.stages = stages
+        self.save_data_path = save_data_path
+        self.is_random = is_random
+        self.record_response_time = record_response_time
+        self.lock_path: str | None = None
+
+    def lock(self) -> bool:
+        """Lock data directory, return False while compaction is running."""
+        if self.lock_path is not None:
+            return True
+        self.lock_path = acquire_session_lock(self.data_dir)
+        return self.lock_path is not None
+
+    def unlock(self) -> None:
+        """Unlock data directory."""
+        if self.lock_path is not None:
+            release_lock(self.lock_path)
+            self.lock_path = None
+
+    def load(self) -> None:
+        """Load quizzes."""
+        # load review quizzes
+        self.review_qid_info: dict[str, list[str]] = {}
+        for stage in GENRE.keys():
+            self.review_qid_info[stage]: list[str] = []
+        if not os.path.exists(self.review_data_path):
+            self.review_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = {}
+            for stage in GENRE.keys():
+                self.review_quizzes[stage] = {"quiz_list": []}
+        else:
+            with open(self.review_data_path, encoding="utf-8") as f:
+                self.review_quizzes = json.load(f)
+            for stage in GENRE.keys():
+                for quiz in self.review_quizzes[stage]["quiz_list"]:
+                    self.review_qid_info[stage].append(quiz["qid"])
+
+        match self.mode:
+            case Mode.NORMAL:
+                with open(self.data_path, encoding="utf-8") as f:
+                    data = json.load(f)
+            case Mode.WRONG:
+                with open(self.save_data_path, encoding="utf-8") as f:
+                    save_data = json.load(f)
+                    data: dict[str, dict[str, list[dict[str, str | list[str]]]]] = save_data["wrong_quizzes"]
+                    self.saved_restart_quizzes = save_data["restart_quizzes"]
+            case Mode.REVIEW:
+                with open(self.review_data_path, encoding="utf-8") as f:
+                    data = json.load(f)
+            case Mode.SLOW:
+                data = load_slow_quizzes(self.data_path, self.response_time_data_path)
+            case Mode.RESTART:
+                with open(self.save_data_path, encoding="utf-8") as f:
+                    save_data = json.load(f)
+                    data = save_data["restart_quizzes"]
+                    wrong_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = save_data["wrong_quizzes"]
+            case _:
+                raise ValueError("Unknown mode.")
+
+        self.quizzes: list[dict[str, str | list[str]]] = []
+        self.restart_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = {}
+        self.wrong_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = {}
+        for stage in GENRE.keys():
+            if stage in self.stages:
+                self.quizzes.extend(data[stage]["quiz_list"])
+            self.restart_quizzes[stage] = {"quiz_list": []}
+            if self.mode == Mode.RESTART:
+                self.wrong_quizzes[stage] = wrong_quizzes[stage]
+            else:
+                self.wrong_quizzes[stage] = {"quiz_list": []}
+        if self.is_random:
+            random.shuffle(self.quizzes)
+
+        self.n_quizzes = len(self.quizzes)
+        self.quiz_idx = 0
+        self.current_quiz = None
+        self.is_answered = False
+        self.response_time_record = ResponseTimeRecord()
+
+    def start_quiz(self) -> None:
+        """Start the current quiz and shuffle its choices."""
+        self.is_answered = False
+        self.is_last = self.quiz_idx + 1 >= self.n_quizzes
+        self.current_quiz = self.quizzes[self.quiz_idx]
+        random.shuffle(self.current_quiz["choices"])
+        self.answer_idx = None
+        for idx, choice in enumerate(self.current_quiz["choices"]):
+            if self.current_quiz["answer"] == choice:
+                self.answer_idx = idx
+        self.quiz_started_time = time.perf_counter_ns()
+
+    def answer(self, selected_idx: int) -> bool:
+        """Answer the current quiz, return whether it is correct."""
+        # record response time in microseconds
+        if self.record_response_time:
+            response_time = (time.perf_counter_ns() - self.quiz_started_time) // 1000
+            self.response_time_record.record(G2S[self.current_quiz["genre"]], self.current_quiz["qid"], response_time)
+
+        is_correct = selected_idx == self.answer_idx
+        if not is_correct:
+            genre = self.current_quiz["genre"]
+            self.wrong_quizzes[G2S[genre]]["quiz_list"].append(self.current_quiz)
+        self.is_answered = True
+        self.quiz_idx += 1
+        return is_correct
+
+    def next(self, review_check: bool) -> None:
+        """Go to the next quiz."""
+        if not self.is_answered:
+            self.quiz_idx += 1
+        self.set_review(review_check)
+
+    def set_review(self, review_check: bool) -> None:
+        """Add or remove the current quiz in review list."""
+        if review_check:
+            self.add_review()
+        else:
+            self.remove_review()
+
+    def add_review(self) -> None:
+        """Add a quiz to review list."""
+        qid = self.current_quiz["qid"]
+        genre = self.current_quiz["genre"]
+        stage = G2S[genre]
+        if qid not in self.review_qid_info[stage]:
+            self.review_quizzes[stage]["quiz_list"].append(self.current_quiz)
+            self.review_qid_info[stage].append(qid)
+
+    def remove_review(self) -> None:
+        """Remove a quiz in review list."""
+        qid = self.current_quiz["qid"]
+        genre = self.current_quiz["genre"]
+        stage = G2S[genre]
+        if qid in self.review_qid_info[stage]:
+            quiz_list = self.review_quizzes[stage]["quiz_list"]
+            for idx, quiz in enumerate(quiz_list):
+                if qid == quiz["qid"]:
+                    del_idx = idx
+                    break
+            del self.review_quizzes[stage]["quiz_list"][del_idx]
+            self.review_qid_info[stage].remove(qid)
+
+    def close(self, review_check: bool, is_finish: bool = False) -> str:
+        """Save quizzes, review list and response time, return the save data path."""
+        # save quizzes
+        if not is_finish or not self.is_answered:
+            for restart_quiz in self.quizzes[self.quiz_idx:]:
+                genre = restart_quiz["genre"]
+                self.restart_quizzes[G2S[genre]]["quiz_list"].append(restart_quiz)
+                if self.mode == Mode.WRONG:
+                    self.wrong_quizzes[G2S[genre]]["quiz_list"].append(restart_quiz)
+        self.set_review(review_check)
+
+        match self.mode:
+            case Mode.NORMAL | Mode.REVIEW | Mode.SLOW:
+                save_data = {
+                    "wrong_quizzes": self.wrong_quizzes,
+                    "restart_quizzes": self.restart_quizzes,
+                }
+                save_data_path = None
+            case Mode.WRONG:
+                save_data = {
+                    "wrong_quizzes": self.wrong_quizzes,
+                    "restart_quizzes": self.saved_restart_quizzes,
+                }
+                save_data_path = self.save_data_path
+            case Mode.RESTART:
+                save_data = {
+                    "wrong_quizzes": self.wrong_quizzes,
+                    "restart_quizzes": self.restart_quizzes,
+                }
+                save_data_path = self.save_data_path
+            case _:
+                raise ValueError
+        if save_data_path is None:
+            save_data_path = write_new_save_data(self.data_dir, self.mode.value, save_data)
+        else:
+            with open(save_data_path, "w", encoding="utf-8") as f:
+                json.dump(save_data, f, indent=4, ensure_ascii=False)
+
+        # save review quizzes
+        with open(self.review_data_path, "w", encoding="utf-8") as f:
+            json.dump(self.review_quizzes, f, indent=4, ensure_ascii=False)
+
+        # save response time
+        if len(self.response_time_record.qid_histograms) > 0:
+            save_response_time(self.response_time_data_path, self.response_time_record)
+        return save_data_path
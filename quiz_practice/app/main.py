@@ -1,10 +1,7 @@
 """App for QUIZ ON-AIR practice."""
-import enum
 import glob
-import json
 import os
-import random
-import sys
+import threading
 
 from typing import Callable
 
@@ -13,45 +10,28 @@ import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
 
+from quiz_practice.app.common import DATA_DIR
+from quiz_practice.app.common import DATA_PATH
+from quiz_practice.app.common import GENRE
+from quiz_practice.app.common import Mode
+from quiz_practice.app.common import RESPONSE_TIME_DATA_PATH
+from quiz_practice.app.common import REVIEW_DATA_PATH
+from quiz_practice.app.common import Session
+from quiz_practice.app.common import XLSX_PATH
+from quiz_practice.utils.response_time import format_response_time_report
+from quiz_practice.utils.response_time import load_response_time
+from quiz_practice.utils.save_data import compact_save_data
+from quiz_practice.utils.save_data import format_compaction_report
+from quiz_practice.utils.save_data import list_save_data
+from quiz_practice.utils.save_data import parse_save_data_filename
 from quiz_practice.utils.utils import parse_xlsx
 
-GENRE = {
-    "stage1": "文学＆歴史",
-    "stage2": "自然科学",
-    "stage3": "現代社会＆地理",
-    "stage4": "グルメ＆趣味",
-    "stage5": "アニメ＆ゲーム",
-}
-G2S = {
-    "文学＆歴史": "stage1",
-    "自然科学": "stage2",
-    "現代社会＆地理": "stage3",
-    "グルメ＆趣味": "stage4",
-    "アニメ＆ゲーム": "stage5",
-}
-
-
-EXE_DIR = os.path.dirname(sys.executable)
-DATA_DIR = os.path.join(EXE_DIR, "data")
-DATA_PATH = os.path.join(DATA_DIR, "data.quiz")
-SAVE_DATA_LIST_PATH = os.path.join(DATA_DIR, "save_data_*.quiz")
-REVIEW_DATA_PATH = os.path.join(DATA_DIR, "review_data.quiz")
-
-WINDOW_WIDTH = 380
+WINDOW_WIDTH = 460
 WINDOW_HEIGHT = 330
 QUIZ_WINDOW_WIDTH = 400
 QUIZ_WINDOW_HEIGHT = 300
 
 
-class Mode(enum.Enum):
-    """Practice mode."""
-
-    NORMAL = "normal"
-    RESTART = "restart"
-    WRONG = "wrong"
-    REVIEW = "review"
-
-
 def set_window_center(window: tk.Tk, width: int, height: int) -> None:
     """Set window center."""
     screen_width = window.winfo_screenwidth()
@@ -82,8 +62,40 @@ class App(tk.Tk):
         self.style.configure("WrongChoice.TButton", anchor=tk.W)
         self.style.configure("CorrectChoice.TButton", anchor=tk.W, background="red")
 
+        # compact save data in background
+        self.compaction_thread = threading.Thread(target=self.compact_save_data, daemon=True)
+        self.compaction_thread.start()
+
         # start rendering
         self.render_genre_selection()
+        self.start_button["state"] = tk.DISABLED
+        self.after(100, self.check_compaction)
+
+    def compact_save_data(self) -> None:
+        """Compact save data."""
+        if os.path.exists(DATA_DIR):
+            report = compact_save_data(DATA_DIR)
+            if report is None:
+                print("save data are in use. compaction skipped.")
+            else:
+                print(format_compaction_report(report))
+
+    def check_compaction(self) -> None:
+        """Update start and mode buttons after compaction."""
+        if self.compaction_thread.is_alive():
+            self.after(100, self.check_compaction)
+            return
+        if os.path.exists(DATA_PATH):
+            self.change_start_state()
+        if len(list_save_data(DATA_DIR)) == 0:
+            self.wrong_mode_button["state"] = tk.DISABLED
+            self.restart_mode_button["state"] = tk.DISABLED
+            if self.mode_var.get() in [Mode.WRONG.value, Mode.RESTART.value]:
+                self.mode_var.set(Mode.NORMAL.value)
+                self.generate_mode_select_side_effect()
+        else:
+            self.wrong_mode_button["state"] = tk.NORMAL
+            self.restart_mode_button["state"] = tk.NORMAL
 
     def render_genre_selection(self) -> None:
         """Render genre selection frame."""
@@ -124,7 +136,7 @@ class App(tk.Tk):
             variable=self.mode_var,
             command=lambda: self.generate_mode_select_side_effect(),
         )
-        if len(glob.glob(SAVE_DATA_LIST_PATH)) == 0:
+        if len(list_save_data(DATA_DIR)) == 0:
             wrong_mode_state = tk.DISABLED
         else:
             wrong_mode_state = tk.NORMAL
@@ -148,7 +160,19 @@ class App(tk.Tk):
             state=review_mode_state,
             command=lambda: self.generate_mode_select_side_effect(),
         )
-        if len(glob.glob(SAVE_DATA_LIST_PATH)) == 0:
+        if not os.path.exists(RESPONSE_TIME_DATA_PATH):
+            slow_mode_state = tk.DISABLED
+        else:
+            slow_mode_state = tk.NORMAL
+        self.slow_mode_button = ttk.Radiobutton(
+            mode_selecting_frame,
+            text="遅い問題から",
+            value=Mode.SLOW.value,
+            variable=self.mode_var,
+            state=slow_mode_state,
+            command=lambda: self.generate_mode_select_side_effect(),
+        )
+        if len(list_save_data(DATA_DIR)) == 0:
             restart_mode_state = tk.DISABLED
         else:
             restart_mode_state = tk.NORMAL
@@ -164,6 +188,7 @@ class App(tk.Tk):
         self.practice_mode_button.pack(side=tk.LEFT, anchor=tk.W)
         self.wrong_mode_button.pack(side=tk.LEFT, anchor=tk.W)
         self.review_mode_button.pack(side=tk.LEFT, anchor=tk.W)
+        self.slow_mode_button.pack(side=tk.LEFT, anchor=tk.W)
         self.restart_mode_button.pack(side=tk.LEFT, anchor=tk.W)
 
         # set other setting frame
@@ -191,8 +216,12 @@ class App(tk.Tk):
         # set loading quiz frame
         loading_quiz_frame = ttk.Frame(self)
         self.loading_quiz_button = ttk.Button(loading_quiz_frame, text="問題集読込み", command=lambda: self.load_quiz())
+        self.response_time_button = ttk.Button(
+            loading_quiz_frame, text="解答時間レポート", command=lambda: self.show_response_time_report()
+        )
         loading_quiz_frame.pack()
-        self.loading_quiz_button.pack(pady=10)
+        self.loading_quiz_button.pack(side=tk.LEFT, padx=5, pady=10)
+        self.response_time_button.pack(side=tk.LEFT, padx=5, pady=10)
 
         # check quiz data
         if not os.path.exists(DATA_PATH):
@@ -232,7 +261,7 @@ class App(tk.Tk):
 
     def change_start_state(self) -> None:
         """Change state of start button."""
-        if not any([ckb_var.get() for ckb_var in self.genre_ckb_vars.values()]):
+        if self.compaction_thread.is_alive() or not any([ckb_var.get() for ckb_var in self.genre_ckb_vars.values()]):
             self.start_button["state"] = tk.DISABLED
         else:
             self.start_button["state"] = tk.NORMAL
@@ -240,7 +269,7 @@ class App(tk.Tk):
     def load_quiz(self) -> None:
         """Load quizzes."""
         self.loading_quiz_button["state"] = tk.DISABLED
-        xlsx_path = os.path.join(EXE_DIR, "クイズオンエア問題集.xlsx")
+        xlsx_path = XLSX_PATH
         if os.path.exists(xlsx_path):
             parse_xlsx(xlsx_path=xlsx_path, save_path=DATA_PATH)
             messagebox.showinfo("問題集読込み", "読込み完了！")
@@ -249,8 +278,30 @@ class App(tk.Tk):
             messagebox.showerror("問題集読込み", f"{xlsx_path} が見つかりません！\n問題集をダウンロードして同じファルダに置いてください！")
         self.loading_quiz_button["state"] = tk.NORMAL
 
+    def show_response_time_report(self) -> None:
+        """Show response time report of all sessions."""
+        if not os.path.exists(RESPONSE_TIME_DATA_PATH):
+            messagebox.showinfo("解答時間レポート", "解答時間の記録がないよ！")
+        else:
+            messagebox.showinfo("解答時間レポート", format_response_time_report(load_response_time(RESPONSE_TIME_DATA_PATH)))
+
     def render_quiz(self) -> None:
         """Render quiz window."""
+        mode = Mode(self.mode_var.get())
+        if mode in [Mode.WRONG, Mode.RESTART]:
+            # the session has been locked before listing save data
+            self.session.is_random = self.set_random_ckb_var.get()
+        else:
+            self.session = Session(
+                data_dir=DATA_DIR,
+                mode=mode,
+                stages=[stage for stage, genre_ckb_var in self.genre_ckb_vars.items() if genre_ckb_var.get()],
+                is_random=self.set_random_ckb_var.get(),
+            )
+            if not self.session.lock():
+                messagebox.showerror("もちうさドリル for Windows", "セーブデータを整理中だよ！少し待ってからやり直してね！")
+                return
+
         self.quiz_window = tk.Toplevel()
         self.quiz_window.title("もちうさドリル for Windows")
         set_window_center(self.quiz_window, width=QUIZ_WINDOW_WIDTH, height=QUIZ_WINDOW_HEIGHT)
@@ -258,66 +309,8 @@ class App(tk.Tk):
         self.quiz_window.grab_set()
         self.quiz_window.focus_set()
 
-        # count save data
-        self.save_data_count = len(glob.glob(SAVE_DATA_LIST_PATH))
-
-        # load review quizzes
-        self.review_qid_info: dict[str, list[str]] = {}
-        for stage in GENRE.keys():
-            self.review_qid_info[stage]: list[str] = []
-        if not os.path.exists(REVIEW_DATA_PATH):
-            self.review_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = {}
-            for stage in GENRE.keys():
-                self.review_quizzes[stage] = {"quiz_list": []}
-        else:
-            with open(REVIEW_DATA_PATH, encoding="utf-8") as f:
-                self.review_quizzes = json.load(f)
-            for stage in GENRE.keys():
-                for quiz in self.review_quizzes[stage]["quiz_list"]:
-                    self.review_qid_info[stage].append(quiz["qid"])
-
-        match self.mode_var.get():
-            case Mode.NORMAL.value:
-                with open(DATA_PATH, encoding="utf-8") as f:
-                    data = json.load(f)
-            case Mode.WRONG.value:
-                with open(self.save_data_path, encoding="utf-8") as f:
-                    save_data = json.load(f)
-                    data: dict[str, dict[str, list[dict[str, str | list[str]]]]] = save_data["wrong_quizzes"]
-                    self.saved_restart_quizzes = save_data["restart_quizzes"]
-            case Mode.REVIEW.value:
-                with open(REVIEW_DATA_PATH, encoding="utf-8") as f:
-                    data = json.load(f)
-            case Mode.RESTART.value:
-                with open(self.save_data_path, encoding="utf-8") as f:
-                    save_data = json.load(f)
-                    data = save_data["restart_quizzes"]
-                    wrong_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = save_data["wrong_quizzes"]
-            case _:
-                raise ValueError("Unknown mode.")
-
-        self.quizzes: list[dict[str, str | list[str]]] = []
-        self.restart_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = {}
-        self.wrong_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = {}
-        print("Check genre...")
-        for stage, genre_ckb_var in self.genre_ckb_vars.items():
-            if genre_ckb_var.get():
-                quiz_list = data[stage]["quiz_list"]
-                self.quizzes.extend(quiz_list)
-            self.restart_quizzes[stage] = {"quiz_list": []}
-            match self.mode_var.get():
-                case Mode.NORMAL.value:
-                    self.wrong_quizzes[stage] = {"quiz_list": []}
-                case Mode.WRONG.value:
-                    self.wrong_quizzes[stage] = {"quiz_list": []}
-                case Mode.REVIEW.value:
-                    self.wrong_quizzes[stage] = {"quiz_list": []}
-                case Mode.RESTART.value:
-                    self.wrong_quizzes[stage] = wrong_quizzes[stage]
-                case _:
-                    raise ValueError("Unknown mode.")
-        if self.set_random_ckb_var.get():
-            random.shuffle(self.quizzes)
+        # load quizzes
+        self.session.load()
 
         # set progress frame
         progress_frame = ttk.Frame(self.quiz_window)
@@ -374,18 +367,18 @@ class App(tk.Tk):
         choice_frame.pack(side=tk.BOTTOM)
 
         # start displaying quizzes
-        self.n_quizzes = len(self.quizzes)
-        if self.n_quizzes == 0:
-            if self.mode_var.get() == Mode.WRONG.value:
+        if self.session.n_quizzes == 0:
+            if self.session.mode == Mode.WRONG:
                 messagebox.showinfo("もちうさドリル for Windows", "間違えた問題がないよ！")
-            elif self.mode_var.get() == Mode.REVIEW.value:
+            elif self.session.mode == Mode.REVIEW:
                 messagebox.showinfo("もちうさドリル for Windows", "復習リストに問題がないよ！")
-            elif self.mode_var.get() == Mode.RESTART.value:
+            elif self.session.mode == Mode.SLOW:
+                messagebox.showinfo("もちうさドリル for Windows", "解答時間の記録がないよ！")
+            elif self.session.mode == Mode.RESTART:
                 messagebox.showinfo("もちうさドリル for Windows", "全て解き終わってるよ！")
+            self.session.unlock()
             self.quiz_window.destroy()
         else:
-            self.quiz_idx = 0
-            self.current_quiz = None
             self.quiz_window.protocol("WM_DELETE_WINDOW", self.pre_quiz_window_close)
             self.display_quiz()
 
@@ -393,25 +386,20 @@ class App(tk.Tk):
 
     def display_quiz(self) -> None:
         """Display quiz."""
+        self.session.start_quiz()
+
         # check finish
-        self.is_answered = False
-        if self.quiz_idx + 1 >= self.n_quizzes:
+        if self.session.is_last:
             self.next_button["text"] = "終了！"
             self.next_button["command"] = lambda: self.pre_quiz_window_close(is_finish=True)
 
-        self.current_quiz = self.quizzes[self.quiz_idx]
-        self.progress_label["text"] = f"({self.quiz_idx+1}問目 / {self.n_quizzes}問中) ジャンル: {self.current_quiz['genre']}"
-        self.quiz_label["text"] = self.current_quiz["quiz"]
-        answer = self.current_quiz["answer"]
-
-        random.shuffle(self.current_quiz["choices"])
-        answer_idx = None
-        for idx, choice in enumerate(self.current_quiz["choices"]):
-            if answer == choice:
-                answer_idx = idx
-        for choice_idx, (choice, choice_button) in enumerate(
-            zip(self.current_quiz["choices"], self.choice_button_list)
-        ):
+        session = self.session
+        current_quiz = session.current_quiz
+        self.progress_label["text"] = f"({session.quiz_idx+1}問目 / {session.n_quizzes}問中) ジャンル: {current_quiz['genre']}"
+        self.quiz_label["text"] = current_quiz["quiz"]
+        answer = current_quiz["answer"]
+        answer_idx = self.session.answer_idx
+        for choice_idx, (choice, choice_button) in enumerate(zip(current_quiz["choices"], self.choice_button_list)):
             choice_button["text"] = f"#{choice_idx+1} {choice}"
             choice_button["style"] = "Choice.TButton"
             choice_button["command"] = self.display_answer_callback(
@@ -423,6 +411,8 @@ class App(tk.Tk):
 
         def display_answer() -> None:
             """Display answer."""
+            self.session.answer(selected_idx)
+
             self.quiz_label["text"] = f"正解は\t #{answer_idx+1} {answer}"
             print(selected_idx)
             for idx, choice_button in enumerate(self.choice_button_list):
@@ -434,117 +424,53 @@ class App(tk.Tk):
                 else:
                     choice_button["style"] = "WrongChoice.TButton"
 
-            if selected_idx != answer_idx:
-                genre = self.current_quiz["genre"]
-                self.wrong_quizzes[G2S[genre]]["quiz_list"].append(self.current_quiz)
-                print("wrong quiz added.")
-            self.is_answered = True
-            self.quiz_idx += 1
-
         return display_answer
 
     def display_next(self) -> None:
         """Display next quiz."""
-        if not self.is_answered:
-            self.quiz_idx += 1
-        if self.review_check_var.get():
-            self.add_review()
-        else:
-            self.remove_review()
+        self.session.next(review_check=self.review_check_var.get())
         self.review_check_var.set(self.default_review_ckb_var.get())
         self.display_quiz()
 
-    def add_review(self) -> None:
-        """Add a quiz to review list."""
-        qid = self.current_quiz["qid"]
-        genre = self.current_quiz["genre"]
-        stage = G2S[genre]
-        if qid not in self.review_qid_info[stage]:
-            self.review_quizzes[stage]["quiz_list"].append(self.current_quiz)
-            self.review_qid_info[stage].append(qid)
-            print("review quiz added.")
-
-    def remove_review(self) -> None:
-        """Remove a quiz in review list."""
-        qid = self.current_quiz["qid"]
-        genre = self.current_quiz["genre"]
-        stage = G2S[genre]
-        if qid in self.review_qid_info[stage]:
-            quiz_list = self.review_quizzes[stage]["quiz_list"]
-            for idx, quiz in enumerate(quiz_list):
-                if qid == quiz["qid"]:
-                    del_idx = idx
-                    break
-            del self.review_quizzes[stage]["quiz_list"][del_idx]
-            self.review_qid_info[stage].remove(qid)
-            print("review quiz removed.")
-
     def pre_quiz_window_close(self, is_finish: bool = False) -> None:
         """Pre-process before closing quiz window."""
-        # save quizzes
-        if not is_finish or not self.is_answered:
-            for restart_quiz in self.quizzes[self.quiz_idx:]:
-                genre = restart_quiz["genre"]
-                self.restart_quizzes[G2S[genre]]["quiz_list"].append(restart_quiz)
-                if self.mode_var.get() == Mode.WRONG.value:
-                    self.wrong_quizzes[G2S[genre]]["quiz_list"].append(restart_quiz)
-        if self.review_check_var.get():
-            self.add_review()
-        else:
-            self.remove_review()
-
-        save_data_filename = f"save_data_{self.save_data_count+1:03d}_{self.mode_var.get()}.quiz"
-        match self.mode_var.get():
-            case Mode.NORMAL.value:
-                save_data = {
-                    "wrong_quizzes": self.wrong_quizzes,
-                    "restart_quizzes": self.restart_quizzes,
-                }
-                save_data_path = os.path.join(DATA_DIR, save_data_filename)
-            case Mode.WRONG.value:
-                save_data = {
-                    "wrong_quizzes": self.wrong_quizzes,
-                    "restart_quizzes": self.saved_restart_quizzes,
-                }
-                save_data_path = self.save_data_path
-            case Mode.REVIEW.value:
-                save_data = {
-                    "wrong_quizzes": self.wrong_quizzes,
-                    "restart_quizzes": self.restart_quizzes,
-                }
-                save_data_path = os.path.join(DATA_DIR, save_data_filename)
-            case Mode.RESTART.value:
-                save_data = {
-                    "wrong_quizzes": self.wrong_quizzes,
-                    "restart_quizzes": self.restart_quizzes,
-                }
-                save_data_path = self.save_data_path
-            case _:
-                raise ValueError
-        with open(save_data_path, "w", encoding="utf-8") as f:
-            json.dump(save_data, f, indent=4, ensure_ascii=False)
+        try:
+            self.session.close(review_check=self.review_check_var.get(), is_finish=is_finish)
+        finally:
+            self.session.unlock()
         self.wrong_mode_button["state"] = tk.NORMAL
         self.restart_mode_button["state"] = tk.NORMAL
-
-        # save review quizzes
-        with open(REVIEW_DATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.review_quizzes, f, indent=4, ensure_ascii=False)
         self.review_mode_button["state"] = tk.NORMAL
+        response_time_record = self.session.response_time_record
+        if len(response_time_record.qid_histograms) > 0:
+            print(format_response_time_report(response_time_record))
+            self.slow_mode_button["state"] = tk.NORMAL
 
         print("closed.")
         self.quiz_window.destroy()
 
+        # show response time of this session
+        if len(response_time_record.qid_histograms) > 0:
+            messagebox.showinfo("今回の解答時間", format_response_time_report(response_time_record))
+
     def render_save_selection(self) -> None:
         """Render quiz window."""
+        # lock before listing save data not to be renumbered by compaction
+        self.session = Session(data_dir=DATA_DIR, mode=Mode(self.mode_var.get()), stages=list(GENRE.keys()))
+        if not self.session.lock():
+            messagebox.showerror("もちうさドリル for Windows", "セーブデータを整理中だよ！少し待ってからやり直してね！")
+            return
+
         self.save_selection_window = tk.Toplevel()
         self.save_selection_window.title("セーブデータ選択")
         set_window_center(self.save_selection_window, width=QUIZ_WINDOW_WIDTH, height=QUIZ_WINDOW_HEIGHT)
 
         self.save_selection_window.grab_set()
         self.save_selection_window.focus_set()
+        self.save_selection_window.protocol("WM_DELETE_WINDOW", self.close_save_selection)
 
         # load save data path list
-        self.save_data_path_list = [save_data_path for save_data_path in glob.glob(SAVE_DATA_LIST_PATH)]
+        self.save_data_path_list = list_save_data(DATA_DIR)
         save_data_path_display_list = self.save_data_path2display()
 
         # set save list frame
@@ -572,16 +498,20 @@ class App(tk.Tk):
         """Set restart data path."""
         selected_idx = self.restart_list_box.curselection()[0]
         self.save_data_path = self.save_data_path_list[selected_idx]
+        self.session.save_data_path = self.save_data_path
         self.save_selection_window.destroy()
         self.render_quiz()
 
+    def close_save_selection(self) -> None:
+        """Close save selection window without starting."""
+        self.session.unlock()
+        self.save_selection_window.destroy()
+
     def save_data_path2display(self) -> list[str]:
         """Convert save_data_path to display format."""
         save_data_path_display_list: list[str] = []
         for save_data_path in self.save_data_path_list:
-            # split save_data_{idx}_{mode}.quiz"
-            filename: str = os.path.basename(save_data_path).split(".")[0]
-            _, _, idx, mode = filename.split("_")
+            idx, mode = parse_save_data_filename(save_data_path)
             match mode:
                 case Mode.NORMAL.value:
                     display_mode = "通常"
@@ -589,9 +519,11 @@ class App(tk.Tk):
                     display_mode = "間違えた問題のみ"
                 case Mode.REVIEW.value:
                     display_mode = "復習リストから"
+                case Mode.SLOW.value:
+                    display_mode = "遅い問題から"
                 case _:
                     raise ValueError(f"Invalid mode {mode}")
-            save_data_path_display_list.append(f"{idx} {display_mode}")
+            save_data_path_display_list.append(f"{idx:03d} {display_mode}")
         return save_data_path_display_list
 
 
@@ -1 +1,3 @@
+from .response_time import *  # NOQA
+from .save_data import *  # NOQA
 from .utils import *  # NOQA
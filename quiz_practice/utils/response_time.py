@@ -0,0 +1,177 @@
+"""Record response time."""
+import json
+import math
+import os
+import time
+
+from .save_data import acquire_lock
+from .save_data import release_lock
+from .utils import G2S
+
+# log-linear buckets (HDR histogram style) with 2**SUB_BUCKET_BITS sub-buckets per power of two,
+# which keeps the relative error of recorded values under 1 / 2**SUB_BUCKET_BITS
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+PERCENTILES = (50, 90, 99)
+S2G = {stage: genre for genre, stage in G2S.items()}
+RESPONSE_TIME_LOCK_NAME = "response_time"
+RESPONSE_TIME_TMP_SUFFIX = ".saving"
+LOCK_STALE_SECONDS = 60  # saving takes far less than this
+LOCK_RETRY_INTERVAL = 0.05
+LOCK_RETRY_COUNT = 100
+
+
+def value2bucket(value: int) -> int:
+    """Convert a value to its bucket index."""
+    shift = max(value.bit_length() - SUB_BUCKET_BITS - 1, 0)
+    return shift * SUB_BUCKET_COUNT + (value >> shift)
+
+
+def bucket2value(bucket: int) -> int:
+    """Convert a bucket index to the median value of the bucket."""
+    shift = max(bucket // SUB_BUCKET_COUNT - 1, 0)
+    sub_bucket = bucket - shift * SUB_BUCKET_COUNT
+    return (sub_bucket << shift) + ((1 << shift) - 1) // 2
+
+
+class Histogram:
+    """Histogram of response time in microseconds."""
+
+    def __init__(self, counts: dict[int, int] | None = None):
+        """Initialize."""
+        self.counts: dict[int, int] = {} if counts is None else counts
+        self.total = sum(self.counts.values())
+
+    def record(self, value: int) -> None:
+        """Record a value."""
+        bucket = value2bucket(max(value, 0))
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+
+    def merge(self, other: "Histogram") -> None:
+        """Merge another histogram."""
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+
+    def percentile(self, percentile: float) -> int:
+        """Return the value at the percentile."""
+        if self.total == 0:
+            return 0
+        rank = max(math.ceil(self.total * percentile / 100), 1)
+        cumulative = 0
+        for bucket in sorted(self.counts.keys()):
+            cumulative += self.counts[bucket]
+            if cumulative >= rank:
+                return bucket2value(bucket)
+        return bucket2value(max(self.counts.keys()))
+
+    def to_dict(self) -> dict[str, int]:
+        """Convert to a JSON serializable dict."""
+        return {str(bucket): count for bucket, count in sorted(self.counts.items())}
+
+    @classmethod
+    def from_dict(cls, counts: dict[str, int]) -> "Histogram":
+        """Convert from a dict made by to_dict."""
+        return cls({int(bucket): count for bucket, count in counts.items()})
+
+
+class ResponseTimeRecord:
+    """Response time histograms per stage and per question."""
+
+    def __init__(self):
+        """Initialize."""
+        self.stage_histograms: dict[str, Histogram] = {}
+        self.qid_histograms: dict[str, Histogram] = {}
+
+    def record(self, stage: str, qid: str, value: int) -> None:
+        """Record a response time in microseconds."""
+        self.stage_histograms.setdefault(stage, Histogram()).record(value)
+        self.qid_histograms.setdefault(qid, Histogram()).record(value)
+
+    def merge(self, other: "ResponseTimeRecord") -> None:
+        """Merge another record."""
+        for stage, histogram in other.stage_histograms.items():
+            self.stage_histograms.setdefault(stage, Histogram()).merge(histogram)
+        for qid, histogram in other.qid_histograms.items():
+            self.qid_histograms.setdefault(qid, Histogram()).merge(histogram)
+
+    def slowest_qids(self, n_qids: int | None = None, percentile: float = 90) -> list[str]:
+        """Return qids sorted from the slowest."""
+        qids = sorted(
+            self.qid_histograms.keys(), key=lambda qid: self.qid_histograms[qid].percentile(percentile), reverse=True
+        )
+        return qids if n_qids is None else qids[:n_qids]
+
+    def to_dict(self) -> dict[str, dict[str, dict[str, int]]]:
+        """Convert to a JSON serializable dict."""
+        return {
+            "stage": {stage: histogram.to_dict() for stage, histogram in self.stage_histograms.items()},
+            "qid": {qid: histogram.to_dict() for qid, histogram in self.qid_histograms.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, dict[str, dict[str, int]]]) -> "ResponseTimeRecord":
+        """Convert from a dict made by to_dict."""
+        record = cls()
+        for stage, counts in data["stage"].items():
+            record.stage_histograms[stage] = Histogram.from_dict(counts)
+        for qid, counts in data["qid"].items():
+            record.qid_histograms[qid] = Histogram.from_dict(counts)
+        return record
+
+
+def load_response_time(path: str) -> ResponseTimeRecord:
+    """Load response time record."""
+    if not os.path.exists(path):
+        return ResponseTimeRecord()
+    with open(path, encoding="utf-8") as f:
+        return ResponseTimeRecord.from_dict(json.load(f))
+
+
+def save_response_time(path: str, record: ResponseTimeRecord) -> None:
+    """Merge response time record into the saved one."""
+    # lock not to lose records of sessions closed at the same time
+    for _ in range(LOCK_RETRY_COUNT):
+        lock_path = acquire_lock(os.path.dirname(path), RESPONSE_TIME_LOCK_NAME, stale_seconds=LOCK_STALE_SECONDS)
+        if lock_path is not None:
+            break
+        time.sleep(LOCK_RETRY_INTERVAL)
+    else:
+        raise TimeoutError(f"{path} is locked by another app.")
+    try:
+        saved_record = load_response_time(path)
+        saved_record.merge(record)
+        # replace atomically not to break the record when the app is killed while writing
+        tmp_path = path + RESPONSE_TIME_TMP_SUFFIX
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(saved_record.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    finally:
+        release_lock(lock_path)
+
+
+def format_histogram(histogram: Histogram) -> str:
+    """Format percentiles of a histogram in seconds."""
+    percentiles = " ".join(f"p{p}={histogram.percentile(p) / 1_000_000:.2f}s" for p in PERCENTILES)
+    return f"{percentiles} (n={histogram.total})"
+
+
+def format_response_time_report(
+    record: ResponseTimeRecord, n_qids: int | None = 10, qids: list[str] | None = None
+) -> str:
+    """Format response time report per genre and of the given or the n slowest (all if None) questions."""
+    lines = ["ジャンル別"]
+    for stage in sorted(record.stage_histograms.keys()):
+        lines.append(f"  {S2G.get(stage, stage)}: {format_histogram(record.stage_histograms[stage])}")
+    if qids is None:
+        lines.append("遅い問題")
+        qids = record.slowest_qids(n_qids)
+    else:
+        lines.append("問題別")
+    for qid in qids:
+        if qid in record.qid_histograms:
+            lines.append(f"  {qid}: {format_histogram(record.qid_histograms[qid])}")
+        else:
+            lines.append(f"  {qid}: 記録なし")
+    return "\n".join(lines)
@@ -0,0 +1,288 @@
+"""Manage save data."""
+import glob
+import json
+import os
+import re
+import time
+
+SAVE_DATA_GLOB = "save_data_*.quiz"
+SAVE_DATA_PATTERN = re.compile(r"^save_data_(?P<idx>[0-9]+)_(?P<mode>[a-z]+)\.quiz$")
+SAVE_DATA_TMP_SUFFIX = ".compacting"
+SAVE_DATA_MERGING_SUFFIX = ".merging"
+LOCK_GLOB = "*.lock"
+COMPACTION_LOCK_NAME = "compaction"
+LOCK_STALE_SECONDS = 24 * 60 * 60  # locks left by crashed apps are ignored after this
+
+
+def parse_save_data_filename(save_data_path: str) -> tuple[int, str]:
+    """Parse save_data_{idx}_{mode}.quiz into (idx, mode)."""
+    match = SAVE_DATA_PATTERN.match(os.path.basename(save_data_path))
+    if match is None:
+        raise ValueError(f"Invalid save data filename {save_data_path}")
+    return int(match["idx"]), match["mode"]
+
+
+def make_save_data_filename(idx: int, mode: str) -> str:
+    """Make save data filename."""
+    return f"save_data_{idx:03d}_{mode}.quiz"
+
+
+def list_save_data(data_dir: str) -> list[str]:
+    """List save data paths sorted by index."""
+    save_data_path_list = []
+    for save_data_path in glob.glob(os.path.join(data_dir, SAVE_DATA_GLOB)):
+        if SAVE_DATA_PATTERN.match(os.path.basename(save_data_path)):
+            save_data_path_list.append(save_data_path)
+    return sorted(save_data_path_list, key=lambda path: parse_save_data_filename(path)[0])
+
+
+def next_save_data_idx(data_dir: str) -> int:
+    """Return the index next to the last save data."""
+    save_data_path_list = list_save_data(data_dir)
+    if len(save_data_path_list) == 0:
+        return 1
+    return parse_save_data_filename(save_data_path_list[-1])[0] + 1
+
+
+def write_new_save_data(data_dir: str, mode: str, save_data: dict) -> str:
+    """Write save data to a new file which never overwrites existing ones, return its path."""
+    idx = next_save_data_idx(data_dir)
+    while True:
+        save_data_path = os.path.join(data_dir, make_save_data_filename(idx, mode))
+        try:
+            # "x" reserves the index even if another session is closing at the same time
+            with open(save_data_path, "x", encoding="utf-8") as f:
+                json.dump(save_data, f, indent=4, ensure_ascii=False)
+            return save_data_path
+        except FileExistsError:
+            idx += 1
+
+
+def is_stale_lock(lock_path: str, stale_seconds: float = LOCK_STALE_SECONDS) -> bool | None:
+    """Return whether a lock is stale, or None if it has already been removed."""
+    try:
+        return time.time() - os.path.getmtime(lock_path) >= stale_seconds
+    except FileNotFoundError:
+        return None
+
+
+def acquire_lock(data_dir: str, name: str, stale_seconds: float = LOCK_STALE_SECONDS) -> str | None:
+    """Create {name}.lock in data_dir, return its path or None if it already exists."""
+    lock_path = os.path.join(data_dir, f"{name}.lock")
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            # retry if the lock is stale or removed by another process meanwhile
+            if is_stale_lock(lock_path, stale_seconds) is False:
+                return None
+            release_lock(lock_path)
+    with os.fdopen(fd, "w") as f:
+        f.write(str(os.getpid()))
+    return lock_path
+
+
+def release_lock(lock_path: str) -> None:
+    """Remove a lock made by acquire_lock."""
+    try:
+        os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+
+
+def is_locked(data_dir: str, excluded_lock_path: str | None = None) -> bool:
+    """Return whether data_dir has a live lock other than excluded_lock_path, removing stale locks."""
+    is_live = False
+    for lock_path in glob.glob(os.path.join(data_dir, LOCK_GLOB)):
+        if excluded_lock_path is not None and os.path.abspath(lock_path) == os.path.abspath(excluded_lock_path):
+            continue
+        match is_stale_lock(lock_path):
+            case True:
+                release_lock(lock_path)
+            case False:
+                is_live = True
+    return is_live
+
+
+def acquire_session_lock(data_dir: str) -> str | None:
+    """Lock data_dir for a practice session, return None while compaction is running."""
+    lock_path = acquire_lock(data_dir, f"session_{os.getpid()}_{time.time_ns()}")
+    if lock_path is not None and is_locked_by_compaction(data_dir):
+        release_lock(lock_path)
+        return None
+    return lock_path
+
+
+def is_locked_by_compaction(data_dir: str) -> bool:
+    """Return whether compaction is running on data_dir."""
+    return is_stale_lock(os.path.join(data_dir, f"{COMPACTION_LOCK_NAME}.lock")) is False
+
+
+def recover_save_data(data_dir: str) -> int:
+    """Recover save data left by an interrupted compaction, return the number of recovered files."""
+    n_recovered = 0
+    for merging_path in glob.glob(os.path.join(data_dir, SAVE_DATA_GLOB + SAVE_DATA_MERGING_SUFFIX)):
+        # source save data are removed only after merging finished
+        os.remove(merging_path)
+    for tmp_path in sorted(glob.glob(os.path.join(data_dir, SAVE_DATA_GLOB + SAVE_DATA_TMP_SUFFIX))):
+        save_data_path = tmp_path[: -len(SAVE_DATA_TMP_SUFFIX)]
+        if os.path.exists(save_data_path):
+            _, mode = parse_save_data_filename(save_data_path)
+            save_data_path = os.path.join(data_dir, make_save_data_filename(next_save_data_idx(data_dir), mode))
+        os.replace(tmp_path, save_data_path)
+        n_recovered += 1
+    return n_recovered
+
+
+def group_overlapping_save_data(save_data_list: list[tuple[str, dict]]) -> list[list[tuple[str, dict]]]:
+    """Group save data of the same mode whose wrong quizzes share qids, keeping the original order."""
+    qid_set_list = [
+        {quiz["qid"] for stage_quizzes in save_data["wrong_quizzes"].values() for quiz in stage_quizzes["quiz_list"]}
+        for _, save_data in save_data_list
+    ]
+    mode_list = [parse_save_data_filename(save_data_path)[1] for save_data_path, _ in save_data_list]
+    group_idx_list = list(range(len(save_data_list)))
+
+    def find(idx: int) -> int:
+        while group_idx_list[idx] != idx:
+            idx = group_idx_list[idx]
+        return idx
+
+    for i in range(len(save_data_list)):
+        for j in range(i + 1, len(save_data_list)):
+            if mode_list[i] == mode_list[j] and not qid_set_list[i].isdisjoint(qid_set_list[j]):
+                group_idx_list[find(j)] = find(i)
+    group_dict: dict[int, list[tuple[str, dict]]] = {}
+    for idx, save_data in enumerate(save_data_list):
+        group_dict.setdefault(find(idx), []).append(save_data)
+    return list(group_dict.values())
+
+
+def count_quizzes(quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]]) -> int:
+    """Count quizzes over all stages."""
+    return sum(len(stage_quizzes["quiz_list"]) for stage_quizzes in quizzes.values())
+
+
+def compact_save_data(data_dir: str, merge: bool = False) -> dict[str, int] | None:
+    """Compact save data, return None without compaction while data_dir is locked.
+
+    Save data with remaining quizzes are kept as they are, and finished save
+    data without wrong quizzes are removed. With merge, finished save data of
+    the same mode whose wrong quizzes overlap are merged into the newest one
+    without duplicates. Finally, save data are renumbered from 1 in the
+    original order.
+    """
+    lock_path = acquire_lock(data_dir, COMPACTION_LOCK_NAME)
+    if lock_path is None:
+        return None
+    try:
+        if is_locked(data_dir, excluded_lock_path=lock_path):
+            return None
+        return _compact_save_data(data_dir, merge)
+    finally:
+        release_lock(lock_path)
+
+
+def _compact_save_data(data_dir: str, merge: bool) -> dict[str, int]:
+    """Compact save data without locking."""
+    report = {
+        "n_recovered": recover_save_data(data_dir),
+        "n_files_before": 0,
+        "n_files_after": 0,
+        "n_removed": 0,
+        "n_merged": 0,
+        "n_renamed": 0,
+        "bytes_before": 0,
+        "bytes_after": 0,
+        "bytes_reclaimed": 0,
+    }
+    save_data_path_list = list_save_data(data_dir)
+    report["n_files_before"] = len(save_data_path_list)
+    report["bytes_before"] = sum(os.path.getsize(path) for path in save_data_path_list)
+
+    # classify save data
+    kept_path_list: list[str] = []
+    removed_path_list: list[str] = []
+    finished_list: list[tuple[str, dict]] = []
+    for save_data_path in save_data_path_list:
+        try:
+            with open(save_data_path, encoding="utf-8") as f:
+                save_data = json.load(f)
+            n_restart_quizzes = count_quizzes(save_data["restart_quizzes"])
+            n_wrong_quizzes = count_quizzes(save_data["wrong_quizzes"])
+        except (OSError, ValueError, KeyError, TypeError):
+            print(f"{save_data_path} is broken. Skip compaction.")
+            kept_path_list.append(save_data_path)
+            continue
+        if n_restart_quizzes > 0:
+            kept_path_list.append(save_data_path)
+        elif n_wrong_quizzes == 0:
+            removed_path_list.append(save_data_path)
+        else:
+            finished_list.append((save_data_path, save_data))
+
+    # merge overlapping wrong quizzes of finished save data into the newest one
+    if merge:
+        for merged_group in group_overlapping_save_data(finished_list):
+            merged_path, merged_save_data = merged_group[-1]
+            if len(merged_group) > 1:
+                merged_wrong_quizzes: dict[str, dict[str, list[dict[str, str | list[str]]]]] = {}
+                merged_qid_set: set[str] = set()
+                for _, save_data in merged_group:
+                    for stage, stage_quizzes in save_data["wrong_quizzes"].items():
+                        merged_wrong_quizzes.setdefault(stage, {"quiz_list": []})
+                        for quiz in stage_quizzes["quiz_list"]:
+                            if quiz["qid"] not in merged_qid_set:
+                                merged_wrong_quizzes[stage]["quiz_list"].append(quiz)
+                                merged_qid_set.add(quiz["qid"])
+                merged_save_data["wrong_quizzes"] = merged_wrong_quizzes
+                merging_path = merged_path + SAVE_DATA_MERGING_SUFFIX
+                with open(merging_path, "w", encoding="utf-8") as f:
+                    json.dump(merged_save_data, f, indent=4, ensure_ascii=False)
+                os.replace(merging_path, merged_path)
+                for save_data_path, _ in merged_group[:-1]:
+                    removed_path_list.append(save_data_path)
+                report["n_merged"] += len(merged_group)
+            kept_path_list.append(merged_path)
+    else:
+        for save_data_path, _ in finished_list:
+            kept_path_list.append(save_data_path)
+
+    for save_data_path in removed_path_list:
+        os.remove(save_data_path)
+    report["n_removed"] = len(removed_path_list)
+
+    # renumber in two phases not to overwrite existing save data
+    kept_path_list.sort(key=lambda path: parse_save_data_filename(path)[0])
+    rename_list: list[tuple[str, str]] = []
+    for new_idx, save_data_path in enumerate(kept_path_list, start=1):
+        idx, mode = parse_save_data_filename(save_data_path)
+        if idx != new_idx:
+            new_save_data_path = os.path.join(data_dir, make_save_data_filename(new_idx, mode))
+            tmp_path = save_data_path + SAVE_DATA_TMP_SUFFIX
+            if os.path.exists(tmp_path):
+                raise FileExistsError(f"{tmp_path} already exists")
+            os.replace(save_data_path, tmp_path)
+            rename_list.append((tmp_path, new_save_data_path))
+    for tmp_path, new_save_data_path in rename_list:
+        os.replace(tmp_path, new_save_data_path)
+    report["n_renamed"] = len(rename_list)
+
+    save_data_path_list = list_save_data(data_dir)
+    report["n_files_after"] = len(save_data_path_list)
+    report["bytes_after"] = sum(os.path.getsize(path) for path in save_data_path_list)
+    report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+    return report
+
+
+def format_compaction_report(report: dict[str, int]) -> str:
+    """Format compaction report."""
+    return (
+        f"セーブデータ: {report['n_files_before']} -> {report['n_files_after']} 件 "
+        f"(削除 {report['n_removed']} 件, 統合 {report['n_merged']} 件, 番号変更 {report['n_renamed']} 件, "
+        f"復旧 {report['n_recovered']} 件)\n"
+        f"容量: {report['bytes_before']} -> {report['bytes_after']} bytes "
+        f"({report['bytes_reclaimed']} bytes 削減)"
+    )
+
@@ -3,8 +3,6 @@ import datetime
 import json
 import os
 
-import openpyxl
-
 G2S = {"文学＆歴史": "stage1", "自然科学": "stage2", "現代社会＆地理": "stage3", "グルメ＆趣味": "stage4", "アニメ＆ゲーム": "stage5"}
 STAGE_CODE = {"stage1": "1", "stage2": "2", "stage3": "3", "stage4": "4", "stage5": "5"}
 
@@ -24,6 +22,9 @@ Q_MAX_COLUMN = 10  # J
 
 def parse_xlsx(xlsx_path: str, save_path: str) -> None:
     """Parse xlsx."""
+    # import here not to slow down starting apps
+    import openpyxl
+
     # init to store data
     quiz_data = {}
     for genre in G2S.keys():